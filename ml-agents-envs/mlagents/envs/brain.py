@@ -214,11 +214,11 @@ class BrainInfo:
                         0 if agent_info.action_mask[k] else 1
                         for k in range(total_num_actions)
                     ]
-        if any([np.isnan(x.reward) for x in agent_info_list]):
+        if any(np.isnan(x.reward) for x in agent_info_list):
             logger.warning(
                 "An agent had a NaN reward for brain " + brain_params.brain_name
             )
-        if any([np.isnan(x.stacked_vector_observation).any() for x in agent_info_list]):
+        if any(np.isnan(x.stacked_vector_observation).any() for x in agent_info_list):
             logger.warning(
                 "An agent had a NaN observation for brain " + brain_params.brain_name
             )
@@ -281,5 +281,24 @@ def safe_concat_np_ndarray(
     return None
 
 
+class AgentIndexCache:
+    """
+    Finds the index of agents in BrainInfos. Looking up every agent of a BrainInfo with agents.index() is quadratic
+    in the number of agents, so this maps the agent ids of each BrainInfo to their index once instead.
+    BrainInfos are identified by id(), so a cache must not outlive the BrainInfos it has seen, and they must not be
+    changed while it is used (e.g. use one cache per call to add_experiences).
+    """
+
+    def __init__(self):
+        self._indices: Dict[int, Dict[str, int]] = {}
+
+    def index(self, brain_info: BrainInfo, agent_id: str) -> int:
+        indices = self._indices.get(id(brain_info))
+        if indices is None:
+            indices = {agent: i for i, agent in enumerate(brain_info.agents)}
+            self._indices[id(brain_info)] = indices
+        return indices[agent_id]
+
+
 # Renaming of dictionary of brain name to BrainInfo for clarity
 AllBrainInfo = Dict[str, BrainInfo]
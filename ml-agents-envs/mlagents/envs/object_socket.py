@@ -0,0 +1,88 @@
+"""
+Sends pickled objects over a stream socket.
+
+With pickle protocol 5 (python 3.8+) the data of large buffers such as numpy arrays is not copied into the pickle.
+It is sent "out-of-band" straight from the array's memory after the (small) pickle, and received directly into
+the memory the unpickled arrays will use. On older versions the objects are pickled normally.
+
+Each message is framed as
+    header: (pickle length, number of buffers)
+    buffer lengths: one per buffer
+    pickle
+    buffers
+"""
+
+import pickle
+import socket
+import struct
+from typing import Any, List
+
+_USE_OUT_OF_BAND = pickle.HIGHEST_PROTOCOL >= 5
+_HEADER = struct.Struct("!QI")
+_BUFFER_LENGTH = struct.Struct("!Q")
+# Stay below IOV_MAX for the number of buffers passed to a single sendmsg call.
+_MAX_SENDMSG_BUFFERS = 512
+
+
+def send_object(sock: socket.socket, obj: Any) -> None:
+    """
+    Pickles obj and sends it over the socket. Raises BrokenPipeError or ConnectionResetError if the other side closed.
+    """
+    buffers: List[memoryview] = []
+    if _USE_OUT_OF_BAND:
+        data = pickle.dumps(
+            obj, protocol=5, buffer_callback=lambda b: buffers.append(b.raw())
+        )
+    else:
+        data = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    header = _HEADER.pack(len(data), len(buffers)) + b"".join(
+        _BUFFER_LENGTH.pack(buffer.nbytes) for buffer in buffers
+    )
+    _send_all(sock, [memoryview(header), memoryview(data)] + buffers)
+
+
+def recv_object(sock: socket.socket) -> Any:
+    """
+    Receives an object sent with send_object. Raises EOFError if the other side closed.
+    """
+    data_length, num_buffers = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))
+    buffer_lengths = [
+        length
+        for (length,) in _BUFFER_LENGTH.iter_unpack(
+            _recv_exactly(sock, num_buffers * _BUFFER_LENGTH.size)
+        )
+    ]
+    data = _recv_exactly(sock, data_length)
+    # The buffers are bytearrays so that the arrays built on top of them are writeable.
+    buffers = [_recv_exactly(sock, length) for length in buffer_lengths]
+    if _USE_OUT_OF_BAND:
+        return pickle.loads(data, buffers=buffers)
+    return pickle.loads(data)
+
+
+def _send_all(sock: socket.socket, views: List[memoryview]) -> None:
+    if not hasattr(sock, "sendmsg"):
+        # sendmsg isn't available on Windows.
+        for view in views:
+            sock.sendall(view)
+        return
+    while views:
+        sent = sock.sendmsg(views[:_MAX_SENDMSG_BUFFERS])
+        # Drop the views that were sent completely, and trim the one that was sent partially.
+        while views and sent >= views[0].nbytes:
+            sent -= views[0].nbytes
+            views.pop(0)
+        if sent:
+            views[0] = views[0][sent:]
+
+
+def _recv_exactly(sock: socket.socket, n_bytes: int) -> bytearray:
+    buffer = bytearray(n_bytes)
+    view = memoryview(buffer)
+    received = 0
+    while received < n_bytes:
+        n_received = sock.recv_into(view[received:])
+        if n_received == 0:
+            raise EOFError("Socket closed while receiving.")
+        received += n_received
+    return buffer
@@ -0,0 +1,180 @@
+import os
+from typing import Dict, List, NamedTuple, Tuple
+
+import numpy as np
+
+from mlagents.envs.brain import AllBrainInfo
+
+try:
+    # These modules were added in python 3.8.
+    from multiprocessing import resource_tracker, shared_memory  # type: ignore
+
+    HAS_SHARED_MEMORY = True
+except ImportError:
+    # On older versions the observations are left in the BrainInfos and pickled along with the rest of the step.
+    HAS_SHARED_MEMORY = False
+
+# Start of each array in a block is aligned to this many bytes.
+_ALIGNMENT = 64
+
+
+class SharedArray(NamedTuple):
+    """
+    Location of an array in a shared memory block. Sent between processes in place of the array itself.
+    """
+
+    shm_name: str
+    offset: int
+    shape: Tuple[int, ...]
+    dtype: str
+
+
+def _aligned(n_bytes: int) -> int:
+    return (n_bytes + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def start_resource_tracker() -> None:
+    """
+    Starts the resource tracker of the main process. Must be called before the workers are started, so that
+    forked workers use it too instead of starting their own (spawned workers are always handed the main process's).
+    Otherwise attaching to a block would register it with a tracker that never sees it being unlinked.
+    """
+    if HAS_SHARED_MEMORY and os.name == "posix":
+        resource_tracker.ensure_running()
+
+
+class SharedObservationWriter:
+    """
+    Used by an environment worker process to copy the observations of each BrainInfo into shared memory, so that
+    only their SharedArray descriptions have to be pickled and sent to the main process.
+
+    There is one block per brain, which is replaced by a larger one when the observations no longer fit.
+    The writer owns the blocks and unlinks them. If the worker dies without doing so, the resource tracker
+    (shared with the main process) unlinks them when the main process exits.
+    """
+
+    def __init__(self):
+        self.blocks: Dict[str, "shared_memory.SharedMemory"] = {}
+
+    def write(self, all_brain_info: AllBrainInfo) -> None:
+        """
+        Replaces the vector and visual observations of each BrainInfo with SharedArrays (in place).
+        :param all_brain_info: BrainInfos returned by the environment.
+        """
+        if not HAS_SHARED_MEMORY:
+            return
+        for brain_name, brain_info in all_brain_info.items():
+            num_agents = len(brain_info.agents)
+            if num_agents == 0:
+                continue
+            vector_obs = brain_info.vector_observations
+            layout: List[Tuple[Tuple[int, ...], np.dtype]] = [
+                (vector_obs.shape, vector_obs.dtype)
+            ]
+            for agent_obs in brain_info.visual_observations:
+                layout.append(((num_agents,) + agent_obs[0].shape, agent_obs[0].dtype))
+            size = sum(
+                _aligned(int(np.prod(shape)) * dtype.itemsize)
+                for shape, dtype in layout
+            )
+            if size == 0:
+                continue
+            block = self._get_block(brain_name, size)
+
+            offset = 0
+            shared_arrays = []
+            for (shape, dtype), obs in zip(
+                layout, [vector_obs] + brain_info.visual_observations
+            ):
+                view: np.ndarray = np.ndarray(
+                    shape, dtype=dtype, buffer=block.buf, offset=offset
+                )
+                if isinstance(obs, np.ndarray):
+                    np.copyto(view, obs)
+                else:
+                    # Visual observations are a list of per-agent arrays
+                    for agent_index, agent_obs in enumerate(obs):
+                        view[agent_index] = agent_obs
+                shared_arrays.append(SharedArray(block.name, offset, shape, dtype.str))
+                offset += _aligned(view.nbytes)
+            # Drop the views so that the block can be closed later.
+            del view
+
+            brain_info.vector_observations = shared_arrays[0]
+            brain_info.visual_observations = shared_arrays[1:]
+
+    def _get_block(self, brain_name: str, size: int) -> "shared_memory.SharedMemory":
+        block = self.blocks.get(brain_name)
+        if block is not None and block.size >= size:
+            return block
+        if block is not None:
+            size = max(size, 2 * block.size)
+            # The worker only steps again after the main process has read the previous step,
+            # so the observations in the old block have already been copied out.
+            block.close()
+            block.unlink()
+        block = shared_memory.SharedMemory(create=True, size=size)
+        self.blocks[brain_name] = block
+        return block
+
+    def close(self) -> None:
+        for block in self.blocks.values():
+            block.close()
+            block.unlink()
+        self.blocks.clear()
+
+
+class SharedObservationReader:
+    """
+    Used by the main process to copy the observations written by a SharedObservationWriter back into the BrainInfos.
+    The observations are copied out of shared memory, since the trainers hold on to them after the worker has
+    overwritten the block with the next step.
+    """
+
+    def __init__(self):
+        self.blocks: Dict[str, "shared_memory.SharedMemory"] = {}
+
+    def read(self, all_brain_info: AllBrainInfo) -> None:
+        """
+        Replaces the SharedArrays of each BrainInfo with the observations they describe (in place).
+        :param all_brain_info: BrainInfos received from a worker.
+        """
+        for brain_name, brain_info in all_brain_info.items():
+            if not isinstance(brain_info.vector_observations, SharedArray):
+                continue
+            block = self._attach(brain_name, brain_info.vector_observations.shm_name)
+            brain_info.vector_observations = self._copy_array(
+                block, brain_info.vector_observations
+            )
+            brain_info.visual_observations = [
+                list(self._copy_array(block, shared_array))
+                for shared_array in brain_info.visual_observations
+            ]
+
+    @staticmethod
+    def _copy_array(
+        block: "shared_memory.SharedMemory", shared_array: SharedArray
+    ) -> np.ndarray:
+        view: np.ndarray = np.ndarray(
+            shared_array.shape,
+            dtype=np.dtype(shared_array.dtype),
+            buffer=block.buf,
+            offset=shared_array.offset,
+        )
+        return view.copy()
+
+    def _attach(self, brain_name: str, shm_name: str) -> "shared_memory.SharedMemory":
+        block = self.blocks.get(brain_name)
+        if block is not None and block.name == shm_name:
+            return block
+        if block is not None:
+            # The worker outgrew this block and switched to a new one (it unlinks the old one).
+            block.close()
+        block = shared_memory.SharedMemory(name=shm_name)
+        self.blocks[brain_name] = block
+        return block
+
+    def close(self) -> None:
+        for block in self.blocks.values():
+            block.close()
+        self.blocks.clear()
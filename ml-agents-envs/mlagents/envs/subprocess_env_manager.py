@@ -1,18 +1,26 @@
 import logging
-from typing import Dict, NamedTuple, List, Any, Optional, Callable, Set
+import socket
+from typing import Dict, NamedTuple, List, Any, Optional, Callable
 import cloudpickle
 
 from mlagents.envs.environment import UnityEnvironment
-from mlagents.envs.exception import UnityCommunicationException
-from multiprocessing import Process, Pipe, Queue
-from multiprocessing.connection import Connection
+from mlagents.envs.exception import (
+    UnityCommunicationException,
+    UnityEnvironmentException,
+)
+from multiprocessing import Process, RawArray, Semaphore
 from queue import Empty as EmptyQueueException
 from mlagents.envs.base_unity_environment import BaseUnityEnvironment
 from mlagents.envs.env_manager import EnvManager, EnvironmentStep
+from mlagents.envs.object_socket import send_object, recv_object
+from mlagents.envs.shared_observations import (
+    SharedObservationReader,
+    SharedObservationWriter,
+    start_resource_tracker,
+)
 from mlagents.envs.timers import (
     TimerNode,
     timed,
-    hierarchical_timer,
     reset_timers,
     get_timer_root,
 )
@@ -21,6 +29,11 @@ from mlagents.envs.action_info import ActionInfo
 
 logger = logging.getLogger("mlagents.envs")
 
+# Number of steps between sending a worker's timers to the main process.
+WORKER_TIMER_INTERVAL = 64
+# Seconds between checks that the workers we wait for are still alive.
+WORKER_ALIVE_CHECK_INTERVAL = 1.0
+
 
 class EnvironmentCommand(NamedTuple):
     name: str
@@ -33,80 +46,198 @@ class EnvironmentResponse(NamedTuple):
     payload: Any
 
 
+class StepCommand(NamedTuple):
+    """
+    Arguments of BaseUnityEnvironment.step(), sent to a worker as the payload of a "step" command.
+    Only these fields of the ActionInfos are sent; in particular not the policy outputs.
+    """
+
+    vector_action: Dict[str, Any]
+    memory: Dict[str, Any]
+    text_action: Dict[str, Any]
+    value: Dict[str, Any]
+
+    @staticmethod
+    def from_action_info(all_action_info: Dict[str, ActionInfo]) -> "StepCommand":
+        step_command = StepCommand({}, {}, {}, {})
+        for brain_name, action_info in all_action_info.items():
+            step_command.vector_action[brain_name] = action_info.action
+            step_command.memory[brain_name] = action_info.memory
+            step_command.text_action[brain_name] = action_info.text
+            step_command.value[brain_name] = action_info.value
+        return step_command
+
+
 class StepResponse(NamedTuple):
     all_brain_info: AllBrainInfo
     timer_root: Optional[TimerNode]
 
 
+class CloudpickledEnvFactory:
+    """
+    Wraps the env factory given to the workers. When a worker is started with "fork" (the default on Linux)
+    the factory is inherited and never pickled. With "spawn" (Windows, and macOS from python 3.8) the worker's
+    arguments are pickled, but function objects such as closures can't be pickled by the standard pickler, so the
+    factory is pickled with cloudpickle instead. This is done once and reused for every worker.
+    """
+
+    def __init__(self, env_factory: Callable[[int], BaseUnityEnvironment]):
+        self.env_factory = env_factory
+        self.pickled_env_factory: Optional[bytes] = None
+
+    def __call__(self, worker_id: int) -> BaseUnityEnvironment:
+        return self.env_factory(worker_id)
+
+    def __reduce__(self):
+        if self.pickled_env_factory is None:
+            self.pickled_env_factory = cloudpickle.dumps(self.env_factory)
+        # The worker process gets the unwrapped factory.
+        return cloudpickle.loads, (self.pickled_env_factory,)
+
+
+class StepQueue:
+    """
+    Lets the environment workers tell the SubprocessEnvManager which of them have a response ready.
+    Unlike a multiprocessing.Queue, nothing is pickled or sent through a pipe: each worker has a slot in a shared
+    array that it writes the message name to, and then releases a semaphore to wake up the main process.
+    Only the main process reads (and clears) the slots.
+    """
+
+    MESSAGE_NAMES = ["", "step", "env_close"]
+
+    def __init__(self, n_env: int):
+        self.slots = RawArray("i", n_env)
+        self.semaphore = Semaphore(0)
+        self.next_slot = 0
+
+    def put(self, response: EnvironmentResponse) -> None:
+        """
+        Called by a worker. Only the name and worker_id of the response are sent.
+        """
+        self.slots[response.worker_id] = self.MESSAGE_NAMES.index(response.name)
+        self.semaphore.release()
+
+    def get(
+        self, block: bool = True, timeout: Optional[float] = None
+    ) -> EnvironmentResponse:
+        """
+        Returns a response (without payload) from one of the workers that have one ready.
+        Raises queue.Empty if block is False and no worker has a response ready, or if none was ready within
+        timeout seconds.
+        """
+        n_env = len(self.slots)
+        while True:
+            if not self.semaphore.acquire(block, timeout):
+                raise EmptyQueueException()
+            # Start where the last search stopped, so that no worker gets starved.
+            for i in range(n_env):
+                worker_id = (self.next_slot + i) % n_env
+                message = self.slots[worker_id]
+                if message:
+                    self.slots[worker_id] = 0
+                    self.next_slot = worker_id + 1
+                    return EnvironmentResponse(
+                        self.MESSAGE_NAMES[message], worker_id, None
+                    )
+            # A worker overwrote its slot (e.g. closing with a step still pending), so its extra release
+            # had no matching slot. Wait for the next one.
+
+    def get_nowait(self) -> EnvironmentResponse:
+        return self.get(block=False)
+
+
 class UnityEnvWorker:
-    def __init__(self, process: Process, worker_id: int, conn: Connection):
+    def __init__(self, process: Process, worker_id: int, conn: socket.socket):
         self.process = process
         self.worker_id = worker_id
         self.conn = conn
         self.previous_step: EnvironmentStep = EnvironmentStep(None, {}, None)
         self.previous_all_action_info: Dict[str, ActionInfo] = {}
+        self.shared_observations = SharedObservationReader()
         self.waiting = False
 
     def send(self, name: str, payload: Any = None) -> None:
         try:
             cmd = EnvironmentCommand(name, payload)
-            self.conn.send(cmd)
-        except (BrokenPipeError, EOFError):
+            send_object(self.conn, cmd)
+        except (BrokenPipeError, ConnectionResetError, EOFError):
             raise UnityCommunicationException("UnityEnvironment worker: send failed.")
 
     def recv(self) -> EnvironmentResponse:
         try:
-            response: EnvironmentResponse = self.conn.recv()
+            response: EnvironmentResponse = recv_object(self.conn)
             return response
-        except (BrokenPipeError, EOFError):
+        except (BrokenPipeError, ConnectionResetError, EOFError):
             raise UnityCommunicationException("UnityEnvironment worker: recv failed.")
 
-    def close(self):
+    def close(self) -> Optional[TimerNode]:
+        """
+        Closes the worker.
+        :return: The timers the worker had not sent yet, or None if it had already stopped.
+        """
+        timer_root = None
         try:
-            self.conn.send(EnvironmentCommand("close"))
-        except (BrokenPipeError, EOFError):
+            send_object(self.conn, EnvironmentCommand("close"))
+            response: EnvironmentResponse = recv_object(self.conn)
+            # Skip anything that was left on the socket, such as a step that was never received.
+            while response.name != "close":
+                response = recv_object(self.conn)
+            timer_root = response.payload
+        except (BrokenPipeError, ConnectionResetError, EOFError):
             logger.debug(
                 f"UnityEnvWorker {self.worker_id} got exception trying to close."
             )
             pass
         logger.debug(f"UnityEnvWorker {self.worker_id} joining process.")
         self.process.join()
+        self.conn.close()
+        self.shared_observations.close()
+        return timer_root
 
 
 def worker(
-    parent_conn: Connection, step_queue: Queue, pickled_env_factory: str, worker_id: int
+    parent_conn: socket.socket,
+    step_queue: StepQueue,
+    env_factory: Callable[[int], UnityEnvironment],
+    worker_id: int,
 ) -> None:
-    env_factory: Callable[[int], UnityEnvironment] = cloudpickle.loads(
-        pickled_env_factory
-    )
     env = env_factory(worker_id)
+    shared_observations = SharedObservationWriter()
+    step_count = 0
 
     def _send_response(cmd_name, payload):
-        parent_conn.send(EnvironmentResponse(cmd_name, worker_id, payload))
+        send_object(parent_conn, EnvironmentResponse(cmd_name, worker_id, payload))
 
     try:
         while True:
-            cmd: EnvironmentCommand = parent_conn.recv()
+            cmd: EnvironmentCommand = recv_object(parent_conn)
             if cmd.name == "step":
-                all_action_info = cmd.payload
-                actions = {}
-                memories = {}
-                texts = {}
-                values = {}
-                for brain_name, action_info in all_action_info.items():
-                    actions[brain_name] = action_info.action
-                    memories[brain_name] = action_info.memory
-                    texts[brain_name] = action_info.text
-                    values[brain_name] = action_info.value
-                all_brain_info = env.step(actions, memories, texts, values)
+                step_command: StepCommand = cmd.payload
+                all_brain_info = env.step(
+                    step_command.vector_action,
+                    step_command.memory,
+                    step_command.text_action,
+                    step_command.value,
+                )
+                # Only send the location of the observations; the main process copies them out of shared memory.
+                shared_observations.write(all_brain_info)
                 # The timers in this process are independent from all the processes and the "main" process
                 # So after we send back the root timer, we can safely clear them.
-                # Note that we could randomly return timers a fraction of the time if we wanted to reduce
-                # the data transferred.
+                # To reduce the data transferred, the timers are only sent every WORKER_TIMER_INTERVAL steps;
+                # in between they keep accumulating. The rest are sent with the reset and close responses.
                 # TODO get gauges from the workers and merge them in the main process too.
-                step_response = StepResponse(all_brain_info, get_timer_root())
-                step_queue.put(EnvironmentResponse("step", worker_id, step_response))
-                reset_timers()
+                step_count += 1
+                send_timers = step_count % WORKER_TIMER_INTERVAL == 0
+                step_response = StepResponse(
+                    all_brain_info, get_timer_root() if send_timers else None
+                )
+                # The step queue only tells the main process which worker is done; the response itself goes
+                # through this worker's socket. Notify first, otherwise we could block on a full socket that
+                # nobody is reading yet.
+                step_queue.put(EnvironmentResponse("step", worker_id, None))
+                _send_response("step", step_response)
+                if send_timers:
+                    reset_timers()
             elif cmd.name == "external_brains":
                 _send_response("external_brains", env.external_brains)
             elif cmd.name == "reset_parameters":
@@ -115,20 +246,19 @@ def worker(
                 all_brain_info = env.reset(
                     cmd.payload[0], cmd.payload[1], cmd.payload[2]
                 )
-                _send_response("reset", all_brain_info)
+                # Also send the timers that haven't been sent with a step yet.
+                _send_response("reset", StepResponse(all_brain_info, get_timer_root()))
+                reset_timers()
             elif cmd.name == "close":
+                _send_response("close", get_timer_root())
                 break
     except (KeyboardInterrupt, UnityCommunicationException):
         print("UnityEnvironment worker: environment stopping.")
         step_queue.put(EnvironmentResponse("env_close", worker_id, None))
     finally:
-        # If this worker has put an item in the step queue that hasn't been processed by the EnvManager, the process
-        # will hang until the item is processed. We avoid this behavior by using Queue.cancel_join_thread()
-        # See https://docs.python.org/3/library/multiprocessing.html#multiprocessing.Queue.cancel_join_thread for
-        # more info.
         logger.debug(f"Worker {worker_id} closing.")
-        step_queue.cancel_join_thread()
-        step_queue.close()
+        shared_observations.close()
+        parent_conn.close()
         env.close()
         logger.debug(f"Worker {worker_id} done.")
 
@@ -139,27 +269,29 @@ class SubprocessEnvManager(EnvManager):
     ):
         super().__init__()
         self.env_workers: List[UnityEnvWorker] = []
-        self.step_queue: Queue = Queue()
+        self.step_queue = StepQueue(n_env)
+        start_resource_tracker()
+        # Need to use cloudpickle for the env factory function since function objects aren't picklable
+        # on Windows as of Python 3.6. It's only pickled if the workers are spawned rather than forked.
+        self._env_factory = CloudpickledEnvFactory(env_factory)
         for worker_idx in range(n_env):
             self.env_workers.append(
-                self.create_worker(worker_idx, self.step_queue, env_factory)
+                self.create_worker(worker_idx, self.step_queue, self._env_factory)
             )
 
     @staticmethod
     def create_worker(
         worker_id: int,
-        step_queue: Queue,
+        step_queue: StepQueue,
         env_factory: Callable[[int], BaseUnityEnvironment],
     ) -> UnityEnvWorker:
-        parent_conn, child_conn = Pipe()
-
-        # Need to use cloudpickle for the env factory function since function objects aren't picklable
-        # on Windows as of Python 3.6.
-        pickled_env_factory = cloudpickle.dumps(env_factory)
+        parent_conn, child_conn = socket.socketpair()
         child_process = Process(
-            target=worker, args=(child_conn, step_queue, pickled_env_factory, worker_id)
+            target=worker, args=(child_conn, step_queue, env_factory, worker_id)
         )
         child_process.start()
+        # The worker has its own handle now; closing ours lets recv() fail if the worker dies.
+        child_conn.close()
         return UnityEnvWorker(child_process, worker_id, parent_conn)
 
     def _queue_steps(self) -> None:
@@ -167,78 +299,119 @@ class SubprocessEnvManager(EnvManager):
             if not env_worker.waiting:
                 env_action_info = self._take_step(env_worker.previous_step)
                 env_worker.previous_all_action_info = env_action_info
-                env_worker.send("step", env_action_info)
+                env_worker.send("step", StepCommand.from_action_info(env_action_info))
                 env_worker.waiting = True
 
     def step(self) -> List[EnvironmentStep]:
         # Queue steps for any workers which aren't in the "waiting" state.
         self._queue_steps()
 
-        worker_steps: List[EnvironmentResponse] = []
-        step_workers: Set[int] = set()
-        # Poll the step queue for completed steps from environment workers until we retrieve
-        # 1 or more, which we will then return as StepInfos
-        while len(worker_steps) < 1:
+        # Block until at least one environment worker has completed its step, then collect
+        # any other steps that completed in the meantime, and return them all as StepInfos.
+        worker_steps: List[EnvironmentResponse] = [
+            self._receive_step(self.step_queue.get())
+        ]
+        while True:
             try:
-                while True:
-                    step = self.step_queue.get_nowait()
-                    if step.name == "env_close":
-                        raise UnityCommunicationException(
-                            "At least one of the environments has closed."
-                        )
-                    self.env_workers[step.worker_id].waiting = False
-                    if step.worker_id not in step_workers:
-                        worker_steps.append(step)
-                        step_workers.add(step.worker_id)
+                step = self.step_queue.get_nowait()
             except EmptyQueueException:
-                pass
+                break
+            worker_steps.append(self._receive_step(step))
 
         step_infos = self._postprocess_steps(worker_steps)
         return step_infos
 
+    def _receive_step(self, step: EnvironmentResponse) -> EnvironmentResponse:
+        env_worker = self.env_workers[step.worker_id]
+        env_worker.waiting = False
+        if step.name == "env_close":
+            raise UnityCommunicationException(
+                "At least one of the environments has closed."
+            )
+        return env_worker.recv()
+
     def reset(
         self,
         config: Optional[Dict] = None,
         train_mode: bool = True,
         custom_reset_parameters: Any = None,
     ) -> List[EnvironmentStep]:
-        while any([ew.waiting for ew in self.env_workers]):
-            if not self.step_queue.empty():
-                step = self.step_queue.get_nowait()
-                self.env_workers[step.worker_id].waiting = False
+        self._discard_pending_steps()
         # First enqueue reset commands for all workers so that they reset in parallel
         for ew in self.env_workers:
             ew.send("reset", (config, train_mode, custom_reset_parameters))
         # Next (synchronously) collect the reset observations from each worker in sequence
+        timer_nodes = []
         for ew in self.env_workers:
-            ew.previous_step = EnvironmentStep(None, ew.recv().payload, None)
+            payload: StepResponse = ew.recv().payload
+            ew.previous_step = EnvironmentStep(None, payload.all_brain_info, None)
+            timer_nodes.append(payload.timer_root)
+        self._merge_worker_timers(timer_nodes)
         return list(map(lambda ew: ew.previous_step, self.env_workers))
 
     @property
     def external_brains(self) -> Dict[str, BrainParameters]:
-        self.env_workers[0].send("external_brains")
-        return self.env_workers[0].recv().payload
+        return self._query_first_worker("external_brains")
 
     @property
     def reset_parameters(self) -> Dict[str, float]:
-        self.env_workers[0].send("reset_parameters")
-        return self.env_workers[0].recv().payload
+        return self._query_first_worker("reset_parameters")
+
+    def _query_first_worker(self, name: str) -> Any:
+        """
+        Sends a command to the first worker and returns the payload of its response.
+        Its step responses come over the same socket, so it must not have a step in progress.
+        """
+        env_worker = self.env_workers[0]
+        if env_worker.waiting:
+            raise UnityEnvironmentException(
+                f"Can't get {name} while the environment is stepping."
+            )
+        env_worker.send(name)
+        return env_worker.recv().payload
 
     def close(self) -> None:
         logger.debug(f"SubprocessEnvManager closing.")
-        self.step_queue.close()
-        self.step_queue.join_thread()
-        for env_worker in self.env_workers:
-            env_worker.close()
+        # A worker that is blocked sending a step would never see the close command.
+        while True:
+            try:
+                self._discard_pending_steps()
+                break
+            except UnityCommunicationException:
+                # The worker died while sending its step; it is no longer waiting, so keep draining the others.
+                logger.debug("Failed to receive a pending step while closing.")
+        timer_nodes = [env_worker.close() for env_worker in self.env_workers]
+        self._merge_worker_timers(timer_nodes)
+
+    def _discard_pending_steps(self) -> None:
+        """
+        Waits for the steps that are still in progress, and discards them.
+        The steps have to be taken off the workers' sockets, since a worker blocks sending a large step
+        until it is read.
+        """
+        while any(ew.waiting for ew in self.env_workers):
+            try:
+                step = self.step_queue.get(timeout=WORKER_ALIVE_CHECK_INTERVAL)
+            except EmptyQueueException:
+                for ew in self.env_workers:
+                    if ew.waiting and not ew.process.is_alive():
+                        # The worker died without notifying us, so its step will never arrive.
+                        ew.waiting = False
+                continue
+            env_worker = self.env_workers[step.worker_id]
+            env_worker.waiting = False
+            if step.name == "step":
+                env_worker.recv()
 
     def _postprocess_steps(
         self, env_steps: List[EnvironmentResponse]
     ) -> List[EnvironmentStep]:
         step_infos = []
-        timer_nodes = []
+        timer_nodes: List[Optional[TimerNode]] = []
         for step in env_steps:
             payload: StepResponse = step.payload
             env_worker = self.env_workers[step.worker_id]
+            env_worker.shared_observations.read(payload.all_brain_info)
             new_step = EnvironmentStep(
                 env_worker.previous_step.current_all_brain_info,
                 payload.all_brain_info,
@@ -247,18 +420,27 @@ class SubprocessEnvManager(EnvManager):
             step_infos.append(new_step)
             env_worker.previous_step = new_step
 
-            if payload.timer_root:
-                timer_nodes.append(payload.timer_root)
-
-        if timer_nodes:
-            with hierarchical_timer("workers") as main_timer_node:
-                for worker_timer_node in timer_nodes:
-                    main_timer_node.merge(
-                        worker_timer_node, root_name="worker_root", is_parallel=True
-                    )
+            timer_nodes.append(payload.timer_root)
+        self._merge_worker_timers(timer_nodes)
 
         return step_infos
 
+    @staticmethod
+    def _merge_worker_timers(timer_nodes: List[Optional[TimerNode]]) -> None:
+        """
+        Merges the timers sent by the workers with their steps, resets and close. They all go into the same
+        "workers" node under the root, so that its totals are complete wherever they were sent from.
+        :param timer_nodes: Root timer node of each worker, or None if a worker didn't send one.
+        """
+        if not any(timer_nodes):
+            return
+        workers_timer_node = get_timer_root().get_child("workers")
+        for worker_timer_node in timer_nodes:
+            if worker_timer_node:
+                workers_timer_node.merge(
+                    worker_timer_node, root_name="worker_root", is_parallel=True
+                )
+
     @timed
     def _take_step(self, last_step: EnvironmentStep) -> Dict[str, ActionInfo]:
         all_action_info: Dict[str, ActionInfo] = {}
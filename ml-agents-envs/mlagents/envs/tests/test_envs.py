@@ -5,7 +5,7 @@ import numpy as np
 
 from mlagents.envs.environment import UnityEnvironment
 from mlagents.envs.exception import UnityEnvironmentException, UnityActionException
-from mlagents.envs.brain import BrainInfo
+from mlagents.envs.brain import AgentIndexCache, BrainInfo
 from mlagents.envs.mock_communicator import MockCommunicator
 
 
@@ -96,6 +96,18 @@ def test_step(mock_communicator, mock_launcher):
     assert brain_info["RealFakeBrain"].local_done[2]
 
 
+def test_agent_index_cache():
+    first = BrainInfo([], np.zeros((3, 1)), [], agents=["a", "b", "c"])
+    second = BrainInfo([], np.zeros((2, 1)), [], agents=["c", "a"])
+    agent_indices = AgentIndexCache()
+    for brain_info in [first, second, first]:
+        for agent_id in brain_info.agents:
+            expected_index = brain_info.agents.index(agent_id)
+            assert agent_indices.index(brain_info, agent_id) == expected_index
+    with pytest.raises(KeyError):
+        agent_indices.index(second, "b")
+
+
 @mock.patch("mlagents.envs.environment.UnityEnvironment.executable_launcher")
 @mock.patch("mlagents.envs.environment.UnityEnvironment.get_communicator")
 def test_close(mock_communicator, mock_launcher):
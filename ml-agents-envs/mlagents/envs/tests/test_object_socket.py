@@ -0,0 +1,51 @@
+import socket
+import threading
+from typing import Any, Dict
+
+import numpy as np
+import pytest
+
+from mlagents.envs.object_socket import send_object, recv_object
+
+
+def test_send_and_recv_objects() -> None:
+    sender, receiver = socket.socketpair()
+    try:
+        big_array = np.random.rand(256, 256)
+        non_contiguous = np.arange(20).reshape(4, 5)[:, ::2]
+        obj: Dict[str, Any] = {
+            "name": "step",
+            "arrays": [big_array, non_contiguous, np.zeros((0, 3))],
+            "nested": {"rewards": [1.0, 2.0]},
+        }
+
+        # The arrays don't fit in the socket's buffer, so send from another thread.
+        def send_objects() -> None:
+            send_object(sender, obj)
+            send_object(sender, "second")
+
+        send_thread = threading.Thread(target=send_objects)
+        send_thread.start()
+
+        received = recv_object(receiver)
+        assert received["name"] == "step"
+        assert received["nested"] == {"rewards": [1.0, 2.0]}
+        for expected, actual in zip(obj["arrays"], received["arrays"]):
+            np.testing.assert_array_equal(expected, actual)
+        # Received arrays can be modified in place
+        received["arrays"][0][0, 0] = -1.0
+        assert recv_object(receiver) == "second"
+        send_thread.join()
+    finally:
+        sender.close()
+        receiver.close()
+
+
+def test_recv_raises_eof_on_close() -> None:
+    sender, receiver = socket.socketpair()
+    sender.close()
+    try:
+        with pytest.raises(EOFError):
+            recv_object(receiver)
+    finally:
+        receiver.close()
@@ -0,0 +1,111 @@
+from unittest import mock
+
+import numpy as np
+import pytest
+
+from mlagents.envs.brain import BrainInfo
+from mlagents.envs import shared_observations
+from mlagents.envs.shared_observations import (
+    SharedArray,
+    SharedObservationReader,
+    SharedObservationWriter,
+)
+
+
+def make_brain_info(num_agents: int, vector_size: int = 3) -> BrainInfo:
+    return BrainInfo(
+        visual_observation=[
+            [np.random.rand(4, 5, 1) for _ in range(num_agents)],
+            [np.random.rand(2, 2, 3) for _ in range(num_agents)],
+        ],
+        vector_observation=np.random.rand(num_agents, vector_size),
+        text_observations=[""] * num_agents,
+        agents=[f"$0-{i}" for i in range(num_agents)],
+    )
+
+
+@pytest.mark.skipif(
+    not shared_observations.HAS_SHARED_MEMORY, reason="Requires python 3.8+"
+)
+def test_observations_round_trip() -> None:
+    writer = SharedObservationWriter()
+    reader = SharedObservationReader()
+    try:
+        for num_agents in [2, 1, 8]:
+            brain_info = make_brain_info(num_agents)
+            expected_vector = brain_info.vector_observations.copy()
+            expected_visual = [list(obs) for obs in brain_info.visual_observations]
+
+            all_brain_info = {"brain": brain_info}
+            writer.write(all_brain_info)
+            assert isinstance(brain_info.vector_observations, SharedArray)
+            assert all(
+                isinstance(obs, SharedArray) for obs in brain_info.visual_observations
+            )
+
+            reader.read(all_brain_info)
+            np.testing.assert_array_equal(
+                brain_info.vector_observations, expected_vector
+            )
+            assert len(brain_info.visual_observations) == len(expected_visual)
+            for actual, expected in zip(
+                brain_info.visual_observations, expected_visual
+            ):
+                assert len(actual) == num_agents
+                for actual_obs, expected_obs in zip(actual, expected):
+                    np.testing.assert_array_equal(actual_obs, expected_obs)
+        # The block was replaced when it had to grow to fit 8 agents
+        assert reader.blocks["brain"].name == writer.blocks["brain"].name
+    finally:
+        writer.close()
+        reader.close()
+
+
+def test_empty_brain_info_is_not_shared() -> None:
+    writer = SharedObservationWriter()
+    brain_info = BrainInfo([], np.zeros((0, 3)), [], agents=[])
+    writer.write({"brain": brain_info})
+    assert isinstance(brain_info.vector_observations, np.ndarray)
+    assert writer.blocks == {}
+
+
+@pytest.mark.skipif(
+    not shared_observations.HAS_SHARED_MEMORY, reason="Requires python 3.8+"
+)
+def test_writer_unlinks_blocks() -> None:
+    writer = SharedObservationWriter()
+    reader = SharedObservationReader()
+    try:
+        all_brain_info = {"brain": make_brain_info(2)}
+        writer.write(all_brain_info)
+        reader.read(all_brain_info)
+        old_name = writer.blocks["brain"].name
+
+        # Growing the block unlinks the old one, even before the reader has seen the new one.
+        writer.write({"brain": make_brain_info(8)})
+        new_name = writer.blocks["brain"].name
+        assert new_name != old_name
+        with pytest.raises(FileNotFoundError):
+            shared_observations.shared_memory.SharedMemory(name=old_name)
+
+        writer.close()
+        with pytest.raises(FileNotFoundError):
+            shared_observations.shared_memory.SharedMemory(name=new_name)
+    finally:
+        writer.close()
+        reader.close()
+
+
+def test_observations_are_pickled_without_shared_memory() -> None:
+    brain_info = make_brain_info(2)
+    vector_obs = brain_info.vector_observations
+    visual_obs = brain_info.visual_observations
+    all_brain_info = {"brain": brain_info}
+    with mock.patch.object(shared_observations, "HAS_SHARED_MEMORY", False):
+        writer = SharedObservationWriter()
+        writer.write(all_brain_info)
+        SharedObservationReader().read(all_brain_info)
+        writer.close()
+    assert brain_info.vector_observations is vector_obs
+    assert brain_info.visual_observations is visual_obs
+    assert writer.blocks == {}
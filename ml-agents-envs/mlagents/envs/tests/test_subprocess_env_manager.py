@@ -1,14 +1,33 @@
+import pickle
+import socket
 import unittest.mock as mock
 from unittest.mock import Mock, MagicMock
 import unittest
 from queue import Empty as EmptyQueue
 
+from mlagents.envs.object_socket import send_object, recv_object
 from mlagents.envs.subprocess_env_manager import (
+    CloudpickledEnvFactory,
+    EnvironmentCommand,
     SubprocessEnvManager,
+    UnityEnvWorker,
     EnvironmentResponse,
+    StepCommand,
     StepResponse,
+    StepQueue,
+)
+from mlagents.envs.action_info import ActionInfo
+from mlagents.envs.timers import (
+    TimerNode,
+    get_timer_root,
+    hierarchical_timer,
+    reset_timers,
 )
 from mlagents.envs.base_unity_environment import BaseUnityEnvironment
+from mlagents.envs.exception import (
+    UnityCommunicationException,
+    UnityEnvironmentException,
+)
 
 
 def mock_env_factory(worker_id):
@@ -18,13 +37,72 @@ def mock_env_factory(worker_id):
 class MockEnvWorker:
     def __init__(self, worker_id, resp=None):
         self.worker_id = worker_id
-        self.process = None
+        self.process = Mock()
+        self.process.is_alive.return_value = True
         self.conn = None
         self.send = Mock()
         self.recv = Mock(return_value=resp)
+        self.close = Mock(return_value=None)
+        self.shared_observations = Mock()
         self.waiting = False
 
 
+class CloudpickledEnvFactoryTest(unittest.TestCase):
+    def test_factory_is_pickled_once_and_unwrapped(self):
+        offset = 10
+        env_factory = CloudpickledEnvFactory(lambda worker_id: worker_id + offset)
+        self.assertEqual(env_factory(1), 11)
+        self.assertIsNone(env_factory.pickled_env_factory)
+
+        unpickled_factory = pickle.loads(pickle.dumps(env_factory))
+        pickled_env_factory = env_factory.pickled_env_factory
+        self.assertIsNotNone(pickled_env_factory)
+        self.assertNotIsInstance(unpickled_factory, CloudpickledEnvFactory)
+        self.assertEqual(unpickled_factory(2), 12)
+
+        pickle.dumps(env_factory)
+        self.assertIs(env_factory.pickled_env_factory, pickled_env_factory)
+
+
+class UnityEnvWorkerTest(unittest.TestCase):
+    def test_close_skips_unread_responses(self):
+        parent_conn, child_conn = socket.socketpair()
+        try:
+            timer_root = TimerNode()
+            timer_root.add_time(1.0)
+            # A step that was never received is still on the socket when the worker replies to close.
+            send_object(
+                child_conn, EnvironmentResponse("step", 0, StepResponse({}, None))
+            )
+            send_object(child_conn, EnvironmentResponse("close", 0, timer_root))
+
+            env_worker = UnityEnvWorker(Mock(), 0, parent_conn)
+            closed_timer_root = env_worker.close()
+            self.assertEqual(closed_timer_root.total, 1.0)
+            self.assertEqual(recv_object(child_conn), EnvironmentCommand("close"))
+            env_worker.process.join.assert_called_once()
+        finally:
+            child_conn.close()
+
+
+class StepQueueTest(unittest.TestCase):
+    def test_get_returns_responses_from_each_worker(self):
+        step_queue = StepQueue(3)
+        step_queue.put(EnvironmentResponse("step", 2, None))
+        step_queue.put(EnvironmentResponse("env_close", 0, None))
+
+        responses = [step_queue.get(), step_queue.get_nowait()]
+        self.assertCountEqual(
+            responses,
+            [
+                EnvironmentResponse("step", 2, None),
+                EnvironmentResponse("env_close", 0, None),
+            ],
+        )
+        with self.assertRaises(EmptyQueue):
+            step_queue.get_nowait()
+
+
 class SubprocessEnvManagerTest(unittest.TestCase):
     def test_environments_are_created(self):
         SubprocessEnvManager.create_worker = MagicMock()
@@ -32,24 +110,160 @@ class SubprocessEnvManagerTest(unittest.TestCase):
         # Creates two processes
         env.create_worker.assert_has_calls(
             [
-                mock.call(0, env.step_queue, mock_env_factory),
-                mock.call(1, env.step_queue, mock_env_factory),
+                mock.call(0, env.step_queue, env._env_factory),
+                mock.call(1, env.step_queue, env._env_factory),
             ]
         )
         self.assertEqual(len(env.env_workers), 2)
 
     def test_reset_passes_reset_params(self):
         SubprocessEnvManager.create_worker = lambda em, worker_id, step_queue, env_factory: MockEnvWorker(
-            worker_id, EnvironmentResponse("reset", worker_id, worker_id)
+            worker_id, EnvironmentResponse("reset", worker_id, StepResponse(worker_id, None))
         )
         manager = SubprocessEnvManager(mock_env_factory, 1)
         params = {"test": "params"}
         manager.reset(params, False)
         manager.env_workers[0].send.assert_called_with("reset", (params, False, None))
 
+    def test_reset_waits_for_pending_steps(self):
+        SubprocessEnvManager.create_worker = lambda em, worker_id, step_queue, env_factory: MockEnvWorker(
+            worker_id, EnvironmentResponse("reset", worker_id, StepResponse(worker_id, None))
+        )
+        manager = SubprocessEnvManager(mock_env_factory, 2)
+        manager.step_queue = Mock()
+        manager.step_queue.get.return_value = EnvironmentResponse("step", 1, None)
+        manager.env_workers[1].waiting = True
+        step_response = EnvironmentResponse("step", 1, StepResponse({}, None))
+        manager.env_workers[1].recv.side_effect = [
+            step_response,
+            EnvironmentResponse("reset", 1, StepResponse(1, None)),
+        ]
+
+        manager.reset()
+        manager.step_queue.get.assert_called_once()
+        self.assertFalse(manager.env_workers[1].waiting)
+        self.assertEqual(manager.env_workers[1].recv.call_count, 2)
+        self.assertEqual(manager.env_workers[1].previous_step.current_all_brain_info, 1)
+
+    def test_worker_timers_are_merged_into_one_node(self):
+        def worker_timers(total):
+            timer_node = TimerNode()
+            timer_node.add_time(total)
+            return timer_node
+
+        SubprocessEnvManager.create_worker = lambda em, worker_id, step_queue, env_factory: MockEnvWorker(
+            worker_id,
+            EnvironmentResponse(
+                "reset", worker_id, StepResponse(worker_id, worker_timers(1.0))
+            ),
+        )
+        reset_timers()
+        try:
+            manager = SubprocessEnvManager(mock_env_factory, 2)
+            manager.reset()
+            manager.env_workers[0].previous_all_action_info = {}
+            with hierarchical_timer("env_step"):
+                step_response = StepResponse(0, worker_timers(0.25))
+                manager._postprocess_steps(
+                    [EnvironmentResponse("step", 0, step_response)]
+                )
+            manager.env_workers[0].close.return_value = worker_timers(0.5)
+            manager.close()
+
+            root = get_timer_root()
+            self.assertNotIn("workers", root.children["env_step"].children)
+            worker_root = root.children["workers"].children["worker_root"]
+            self.assertEqual(worker_root.total, 2.75)
+            self.assertEqual(worker_root.count, 4)
+        finally:
+            reset_timers()
+
+    def test_close_after_env_close(self):
+        SubprocessEnvManager.create_worker = lambda em, worker_id, step_queue, env_factory: MockEnvWorker(
+            worker_id, EnvironmentResponse("step", worker_id, StepResponse({}, None))
+        )
+        manager = SubprocessEnvManager(mock_env_factory, 3)
+        for env_worker in manager.env_workers:
+            env_worker.previous_step = None
+        manager._take_step = Mock(return_value={})
+        manager.step_queue = Mock()
+        manager.step_queue.get.side_effect = [
+            EnvironmentResponse("env_close", 1, None),
+            EnvironmentResponse("step", 0, None),
+            EnvironmentResponse("step", 2, None),
+        ]
+        manager.env_workers[1].process.is_alive.return_value = False
+
+        with self.assertRaises(UnityCommunicationException):
+            manager.step()
+        self.assertEqual(
+            [env_worker.waiting for env_worker in manager.env_workers],
+            [True, False, True],
+        )
+
+        manager.close()
+        self.assertEqual(manager.step_queue.get.call_count, 3)
+        manager.env_workers[0].recv.assert_called_once()
+        manager.env_workers[1].recv.assert_not_called()
+        manager.env_workers[2].recv.assert_called_once()
+        for env_worker in manager.env_workers:
+            self.assertFalse(env_worker.waiting)
+            env_worker.close.assert_called_once()
+
+    def test_close_skips_dead_workers(self):
+        SubprocessEnvManager.create_worker = lambda em, worker_id, step_queue, env_factory: MockEnvWorker(
+            worker_id
+        )
+        manager = SubprocessEnvManager(mock_env_factory, 2)
+        manager.step_queue = Mock()
+        manager.step_queue.get.side_effect = EmptyQueue()
+        manager.env_workers[0].waiting = True
+        manager.env_workers[0].process.is_alive.return_value = False
+
+        manager.close()
+        manager.step_queue.get.assert_called_once()
+        manager.env_workers[0].recv.assert_not_called()
+        self.assertFalse(manager.env_workers[0].waiting)
+        manager.env_workers[0].close.assert_called_once()
+
+    def test_close_waits_for_pending_steps(self):
+        SubprocessEnvManager.create_worker = lambda em, worker_id, step_queue, env_factory: MockEnvWorker(
+            worker_id, EnvironmentResponse("step", worker_id, StepResponse({}, None))
+        )
+        manager = SubprocessEnvManager(mock_env_factory, 3)
+        manager.step_queue = Mock()
+        manager.step_queue.get.side_effect = [
+            EnvironmentResponse("step", 2, None),
+            EnvironmentResponse("env_close", 0, None),
+        ]
+        manager.env_workers[0].waiting = True
+        manager.env_workers[2].waiting = True
+
+        manager.close()
+        self.assertEqual(manager.step_queue.get.call_count, 2)
+        manager.env_workers[0].recv.assert_not_called()
+        manager.env_workers[1].recv.assert_not_called()
+        manager.env_workers[2].recv.assert_called_once()
+        for env_worker in manager.env_workers:
+            self.assertFalse(env_worker.waiting)
+            env_worker.close.assert_called_once()
+
+    def test_queries_wait_for_idle_worker(self):
+        SubprocessEnvManager.create_worker = lambda em, worker_id, step_queue, env_factory: MockEnvWorker(
+            worker_id, EnvironmentResponse("external_brains", worker_id, {"brain": 0})
+        )
+        manager = SubprocessEnvManager(mock_env_factory, 1)
+        self.assertEqual(manager.external_brains, {"brain": 0})
+        manager.env_workers[0].send.assert_called_once_with("external_brains")
+
+        manager.env_workers[0].waiting = True
+        with self.assertRaises(UnityEnvironmentException):
+            manager.reset_parameters
+        manager.env_workers[0].send.assert_called_once()
+
     def test_reset_collects_results_from_all_envs(self):
         SubprocessEnvManager.create_worker = lambda em, worker_id, step_queue, env_factory: MockEnvWorker(
-            worker_id, EnvironmentResponse("reset", worker_id, worker_id)
+            worker_id, EnvironmentResponse("reset", worker_id, StepResponse(worker_id, None))
         )
         manager = SubprocessEnvManager(mock_env_factory, 4)
 
@@ -66,26 +280,37 @@ class SubprocessEnvManagerTest(unittest.TestCase):
 
     def test_step_takes_steps_for_all_non_waiting_envs(self):
         SubprocessEnvManager.create_worker = lambda em, worker_id, step_queue, env_factory: MockEnvWorker(
-            worker_id, EnvironmentResponse("step", worker_id, worker_id)
+            worker_id,
+            EnvironmentResponse("step", worker_id, StepResponse(worker_id, None)),
         )
         manager = SubprocessEnvManager(mock_env_factory, 3)
         manager.step_queue = Mock()
+        manager.step_queue.get.return_value = EnvironmentResponse("step", 0, None)
         manager.step_queue.get_nowait.side_effect = [
-            EnvironmentResponse("step", 0, StepResponse(0, None)),
-            EnvironmentResponse("step", 1, StepResponse(1, None)),
+            EnvironmentResponse("step", 1, None),
             EmptyQueue(),
         ]
-        step_mock = Mock()
+        all_action_info = {"brain": ActionInfo("action", "memory", "text", "value", {})}
         last_steps = [Mock(), Mock(), Mock()]
         manager.env_workers[0].previous_step = last_steps[0]
         manager.env_workers[1].previous_step = last_steps[1]
         manager.env_workers[2].previous_step = last_steps[2]
         manager.env_workers[2].waiting = True
-        manager._take_step = Mock(return_value=step_mock)
+        manager._take_step = Mock(return_value=all_action_info)
         res = manager.step()
         for i, env in enumerate(manager.env_workers):
             if i < 2:
-                env.send.assert_called_with("step", step_mock)
+                env.send.assert_called_with(
+                    "step",
+                    StepCommand(
+                        {"brain": "action"},
+                        {"brain": "memory"},
+                        {"brain": "text"},
+                        {"brain": "value"},
+                    ),
+                )
+                env.recv.assert_called()
+                manager.step_queue.get.assert_called_once()
                 manager.step_queue.get_nowait.assert_called()
                 # Check that the "last steps" are set to the value returned for each step
                 self.assertEqual(
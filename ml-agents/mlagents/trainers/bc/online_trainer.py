@@ -5,7 +5,7 @@
 import logging
 import numpy as np
 
-from mlagents.envs.brain import AllBrainInfo
+from mlagents.envs.brain import AgentIndexCache, AllBrainInfo
 from mlagents.envs.action_info import ActionInfoOutputs
 from mlagents.trainers.bc.trainer import BCTrainer
 
@@ -70,13 +70,13 @@ class OnlineBCTrainer(BCTrainer):
         for agent_id in info_teacher.agents:
             self.demonstration_buffer[agent_id].last_brain_info = info_teacher
 
-        for agent_id in next_info_teacher.agents:
+        agent_indices = AgentIndexCache()
+        for next_idx, agent_id in enumerate(next_info_teacher.agents):
             stored_info_teacher = self.demonstration_buffer[agent_id].last_brain_info
             if stored_info_teacher is None:
                 continue
             else:
-                idx = stored_info_teacher.agents.index(agent_id)
-                next_idx = next_info_teacher.agents.index(agent_id)
+                idx = agent_indices.index(stored_info_teacher, agent_id)
                 if stored_info_teacher.text_observations[idx] != "":
                     info_teacher_record, info_teacher_reset = (
                         stored_info_teacher.text_observations[idx].lower().split(",")
@@ -3,6 +3,7 @@
 # Contains an implementation of Behavioral Cloning Algorithm
 
 import logging
+from collections import defaultdict
 
 import numpy as np
 
@@ -30,8 +31,8 @@ class BCTrainer(Trainer):
         super(BCTrainer, self).__init__(brain, trainer_parameters, training, run_id)
         self.policy = BCPolicy(seed, brain, trainer_parameters, load)
         self.n_sequences = 1
-        self.cumulative_rewards = {}
-        self.episode_steps = {}
+        self.cumulative_rewards = defaultdict(int)
+        self.episode_steps = defaultdict(int)
         self.stats = {
             "Losses/Cloning Loss": [],
             "Environment/Episode Length": [],
@@ -62,18 +63,13 @@ class BCTrainer(Trainer):
         for agent_id in info_student.agents:
             self.evaluation_buffer[agent_id].last_brain_info = info_student
 
-        for agent_id in next_info_student.agents:
+        for next_idx, agent_id in enumerate(next_info_student.agents):
             stored_info_student = self.evaluation_buffer[agent_id].last_brain_info
             if stored_info_student is None:
                 continue
             else:
-                next_idx = next_info_student.agents.index(agent_id)
-                if agent_id not in self.cumulative_rewards:
-                    self.cumulative_rewards[agent_id] = 0
                 self.cumulative_rewards[agent_id] += next_info_student.rewards[next_idx]
                 if not next_info_student.local_done[next_idx]:
-                    if agent_id not in self.episode_steps:
-                        self.episode_steps[agent_id] = 0
                     self.episode_steps[agent_id] += 1
 
     def process_experiences(
@@ -95,7 +91,7 @@ class BCTrainer(Trainer):
                 self.stats["Environment/Episode Length"].append(
                     self.episode_steps.get(agent_id, 0)
                 )
-                self.reward_buffer.appendleft(self.cumulative_rewards.get(agent_id, 0))
+                self.add_episode_reward(self.cumulative_rewards.get(agent_id, 0))
                 self.cumulative_rewards[agent_id] = 0
                 self.episode_steps[agent_id] = 0
 
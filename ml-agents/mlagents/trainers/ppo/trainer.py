@@ -76,7 +76,7 @@ class PPOTrainer(RLTrainer):
             )
 
         for _reward_signal in self.policy.reward_signals.keys():
-            self.collected_rewards[_reward_signal] = {}
+            self.collected_rewards[_reward_signal] = defaultdict(int)
 
     def process_experiences(
         self, current_info: AllBrainInfo, new_info: AllBrainInfo
@@ -163,7 +163,7 @@ class PPOTrainer(RLTrainer):
                             self.stats["Environment/Cumulative Reward"].append(
                                 rewards.get(agent_id, 0)
                             )
-                            self.reward_buffer.appendleft(rewards.get(agent_id, 0))
+                            self.add_episode_reward(rewards.get(agent_id, 0))
                             rewards[agent_id] = 0
                         else:
                             self.stats[
@@ -1,9 +1,10 @@
 # # Unity ML-Agents Toolkit
 import logging
+from collections import defaultdict
 from typing import Dict, List, Any, NamedTuple
 import numpy as np
 
-from mlagents.envs.brain import AllBrainInfo, BrainInfo
+from mlagents.envs.brain import AgentIndexCache, AllBrainInfo, BrainInfo
 from mlagents.envs.action_info import ActionInfoOutputs
 from mlagents.trainers.buffer import Buffer
 from mlagents.trainers.trainer import Trainer, UnityTrainerException
@@ -42,9 +43,9 @@ class RLTrainer(Trainer):
         # collected_rewards is a dictionary from name of reward signal to a dictionary of agent_id to cumulative reward
         # used for reporting only. We always want to report the environment reward to Tensorboard, regardless
         # of what reward signals are actually present.
-        self.collected_rewards = {"environment": {}}
+        self.collected_rewards = {"environment": defaultdict(int)}
         self.training_buffer = Buffer()
-        self.episode_steps = {}
+        self.episode_steps = defaultdict(int)
 
     def construct_curr_info(self, next_info: BrainInfo) -> BrainInfo:
         """
@@ -66,11 +67,12 @@ class RLTrainer(Trainer):
         prev_vector_actions = []
         prev_text_actions = []
         action_masks = []
+        agent_indices = AgentIndexCache()
         for agent_id in next_info.agents:
             agent_brain_info = self.training_buffer[agent_id].last_brain_info
             if agent_brain_info is None:
                 agent_brain_info = next_info
-            agent_index = agent_brain_info.agents.index(agent_id)
+            agent_index = agent_indices.index(agent_brain_info, agent_id)
             for i in range(len(next_info.visual_observations)):
                 visual_observations[i].append(
                     agent_brain_info.visual_observations[i][agent_index]
@@ -161,14 +163,14 @@ class RLTrainer(Trainer):
             reward_signals=tmp_reward_signal_outs, environment=tmp_environment
         )
 
-        for agent_id in next_info.agents:
+        agent_indices = AgentIndexCache()
+        for next_idx, agent_id in enumerate(next_info.agents):
             stored_info = self.training_buffer[agent_id].last_brain_info
             stored_take_action_outputs = self.training_buffer[
                 agent_id
             ].last_take_action_outputs
             if stored_info is not None:
-                idx = stored_info.agents.index(agent_id)
-                next_idx = next_info.agents.index(agent_id)
+                idx = agent_indices.index(stored_info, agent_id)
                 if not stored_info.local_done[idx]:
                     for i, _ in enumerate(stored_info.visual_observations):
                         self.training_buffer[agent_id]["visual_obs%d" % i].append(
@@ -216,8 +218,6 @@ class RLTrainer(Trainer):
                     )
 
                     for name, rewards in self.collected_rewards.items():
-                        if agent_id not in rewards:
-                            rewards[agent_id] = 0
                         if name == "environment":
                             # Report the reward from the environment
                             rewards[agent_id] += rewards_out.environment[next_idx]
@@ -227,8 +227,6 @@ class RLTrainer(Trainer):
                                 name
                             ].scaled_reward[next_idx]
                 if not next_info.local_done[next_idx]:
-                    if agent_id not in self.episode_steps:
-                        self.episode_steps[agent_id] = 0
                     self.episode_steps[agent_id] += 1
         self.trainer_metrics.end_experience_collection_timer()
 
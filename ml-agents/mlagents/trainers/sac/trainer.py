@@ -99,9 +99,9 @@ class SACTrainer(RLTrainer):
             )
 
         for _reward_signal in self.policy.reward_signals.keys():
-            self.collected_rewards[_reward_signal] = {}
+            self.collected_rewards[_reward_signal] = defaultdict(int)
 
-        self.episode_steps = {}
+        self.episode_steps = defaultdict(int)
 
     def save_model(self) -> None:
         """
@@ -212,7 +212,7 @@ class SACTrainer(RLTrainer):
                             self.stats["Environment/Cumulative Reward"].append(
                                 rewards.get(agent_id, 0)
                             )
-                            self.reward_buffer.appendleft(rewards.get(agent_id, 0))
+                            self.add_episode_reward(rewards.get(agent_id, 0))
                             rewards[agent_id] = 0
                         else:
                             self.stats[
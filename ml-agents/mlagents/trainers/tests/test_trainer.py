@@ -0,0 +1,26 @@
+import math
+from unittest.mock import MagicMock
+
+import numpy as np
+
+from mlagents.trainers.trainer import Trainer
+
+
+def test_reward_mean(tmpdir):
+    brain = MagicMock()
+    brain.brain_name = "test_brain"
+    trainer = Trainer(
+        brain, {"summary_path": str(tmpdir)}, True, "run_id", reward_buff_cap=3
+    )
+    assert math.isnan(trainer.reward_mean)
+
+    for reward in [1.0, 2.0, 3.0, 4.0, 5.0]:
+        trainer.add_episode_reward(reward)
+        assert trainer.reward_mean == np.mean(trainer.reward_buffer)
+    assert list(trainer.reward_buffer) == [5.0, 4.0, 3.0]
+
+    trainer.clear_reward_buffer()
+    assert len(trainer.reward_buffer) == 0
+    assert math.isnan(trainer.reward_mean)
+    trainer.add_episode_reward(7.0)
+    assert trainer.reward_mean == 7.0
@@ -1,8 +1,9 @@
-from unittest.mock import MagicMock, Mock, patch
+from unittest.mock import MagicMock, Mock, call, patch
 
 import yaml
 import pytest
 
+from mlagents.trainers.trainer import Trainer
 from mlagents.trainers.trainer_controller import TrainerController
 from mlagents.envs.subprocess_env_manager import EnvironmentStep
 from mlagents.envs.sampler_class import SamplerManager
@@ -169,13 +170,32 @@ def test_take_step_adds_experiences_to_trainer_and_trains():
     tc.advance(env_mock)
     env_mock.reset.assert_not_called()
     env_mock.step.assert_called_once()
-    trainer_mock.add_experiences.assert_called_once_with(
-        new_step_info.previous_all_brain_info,
-        new_step_info.current_all_brain_info,
-        new_step_info.brain_name_to_action_info["testbrain"].outputs,
-    )
-    trainer_mock.process_experiences.assert_called_once_with(
-        new_step_info.previous_all_brain_info, new_step_info.current_all_brain_info
-    )
+    trainer_mock.add_and_process_experiences.assert_called_once_with([new_step_info])
     trainer_mock.update_policy.assert_called_once()
     trainer_mock.increment_step.assert_called_once()
+
+
+def test_add_and_process_experiences_handles_steps_in_order():
+    trainer_mock = Mock()
+    trainer_mock.brain_name = "testbrain"
+    step_infos = [
+        EnvironmentStep(Mock(), Mock(), MagicMock()),
+        EnvironmentStep(Mock(), Mock(), MagicMock()),
+    ]
+
+    Trainer.add_and_process_experiences(trainer_mock, step_infos)
+    expected_calls = []
+    for step_info in step_infos:
+        expected_calls.append(
+            call.add_experiences(
+                step_info.previous_all_brain_info,
+                step_info.current_all_brain_info,
+                step_info.brain_name_to_action_info["testbrain"].outputs,
+            )
+        )
+        expected_calls.append(
+            call.process_experiences(
+                step_info.previous_all_brain_info, step_info.current_all_brain_info
+            )
+        )
+    assert trainer_mock.mock_calls == expected_calls
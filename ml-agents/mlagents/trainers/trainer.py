@@ -7,6 +7,7 @@ import numpy as np
 from collections import deque, defaultdict
 
 from mlagents.envs.action_info import ActionInfoOutputs
+from mlagents.envs.env_manager import EnvironmentStep
 from mlagents.envs.exception import UnityException
 from mlagents.envs.timers import set_gauge
 from mlagents.trainers.trainer_metrics import TrainerMetrics
@@ -58,6 +59,8 @@ class Trainer(object):
         )
         self.summary_writer = tf.summary.FileWriter(self.summary_path)
         self._reward_buffer: Deque[float] = deque(maxlen=reward_buff_cap)
+        # Running sum of the reward buffer, kept up to date by add_episode_reward and clear_reward_buffer.
+        self._reward_sum = 0.0
         self.policy: TFPolicy = None
         self.step: int = 0
 
@@ -126,11 +129,41 @@ class Trainer(object):
         """
         Returns the reward buffer. The reward buffer contains the cumulative
         rewards of the most recent episodes completed by agents using this
-        trainer.
+        trainer. Use add_episode_reward and clear_reward_buffer to modify it, so that reward_mean stays correct.
         :return: the reward buffer.
         """
         return self._reward_buffer
 
+    @property
+    def reward_mean(self) -> float:
+        """
+        Returns the mean of the cumulative rewards in the reward buffer, or NaN if it is empty.
+        """
+        if not self._reward_buffer:
+            return float("nan")
+        return self._reward_sum / len(self._reward_buffer)
+
+    def add_episode_reward(self, reward: float) -> None:
+        """
+        Adds the cumulative reward of a finished episode to the front of the reward buffer.
+        :param reward: The cumulative reward of the episode.
+        """
+        if len(self._reward_buffer) == self._reward_buffer.maxlen:
+            if not self._reward_buffer:
+                # The buffer has a size of 0.
+                return
+            # The oldest reward falls off the end.
+            self._reward_sum -= self._reward_buffer[-1]
+        self._reward_buffer.appendleft(reward)
+        self._reward_sum += reward
+
+    def clear_reward_buffer(self) -> None:
+        """
+        Removes all the rewards from the reward buffer.
+        """
+        self._reward_buffer.clear()
+        self._reward_sum = 0.0
+
     def increment_step(self, n_steps: int) -> None:
         """
         Increment the step count of the trainer
@@ -263,6 +296,23 @@ class Trainer(object):
             "The process_experiences method was not implemented."
         )
 
+    def add_and_process_experiences(self, step_infos: List[EnvironmentStep]) -> None:
+        """
+        Adds and processes the experiences of a batch of environment steps, in order.
+        Trainers can override this to handle the whole batch at once; by default each step is passed to
+        add_experiences and then to process_experiences.
+        :param step_infos: The environment steps returned by the EnvManager.
+        """
+        for step_info in step_infos:
+            self.add_experiences(
+                step_info.previous_all_brain_info,
+                step_info.current_all_brain_info,
+                step_info.brain_name_to_action_info[self.brain_name].outputs,
+            )
+            self.process_experiences(
+                step_info.previous_all_brain_info, step_info.current_all_brain_info
+            )
+
     def end_episode(self):
         """
         A signal that the Episode has ended. The buffer must be reset.
@@ -80,11 +80,11 @@ class TrainerController(object):
                     )
                     brain_names_to_measure_vals[brain_name] = measure_val
                 elif curriculum.measure == "reward":
-                    measure_val = np.mean(self.trainers[brain_name].reward_buffer)
+                    measure_val = self.trainers[brain_name].reward_mean
                     brain_names_to_measure_vals[brain_name] = measure_val
         else:
             for brain_name, trainer in self.trainers.items():
-                measure_val = np.mean(trainer.reward_buffer)
+                measure_val = trainer.reward_mean
                 brain_names_to_measure_vals[brain_name] = measure_val
         return brain_names_to_measure_vals
 
@@ -113,9 +113,12 @@ class TrainerController(object):
 
     def _write_timing_tree(self) -> None:
         timing_path = f"{self.summaries_dir}/{self.run_id}_timers.json"
+        # Serialize up front so the file is written in one call instead of many small ones.
+        timing_json = json.dumps(get_timer_tree(), indent=2, ensure_ascii=False)
+        data = timing_json.encode("utf-8")
         try:
-            with open(timing_path, "w") as f:
-                json.dump(get_timer_tree(), f, indent=2)
+            with open(timing_path, "wb") as f:
+                f.write(data)
         except FileNotFoundError:
             self.logger.warning(
                 f"Unable to save to {timing_path}. Make sure the directory exists"
@@ -162,7 +165,7 @@ class TrainerController(object):
 
     def _not_done_training(self) -> bool:
         return (
-            any([t.get_step <= t.get_max_steps for k, t in self.trainers.items()])
+            any(t.get_step <= t.get_max_steps for t in self.trainers.values())
             or not self.train_model
         )
 
@@ -217,8 +220,9 @@ class TrainerController(object):
         if self.train_model:
             self._write_training_metrics()
             self._export_graph()
-        self._write_timing_tree()
+        # Close the environments first, so that the timers they send on close are in the timing tree.
         env_manager.close()
+        self._write_timing_tree()
 
     def end_trainer_episodes(
         self, env: EnvManager, lessons_incremented: Dict[str, bool]
@@ -230,7 +234,7 @@ class TrainerController(object):
             trainer.end_episode()
         for brain_name, changed in lessons_incremented.items():
             if changed:
-                self.trainers[brain_name].reward_buffer.clear()
+                self.trainers[brain_name].clear_reward_buffer()
 
     def reset_env_if_ready(self, env: EnvManager, steps: int) -> None:
         if self.meta_curriculum:
@@ -269,18 +273,11 @@ class TrainerController(object):
             new_step_infos = env.step()
             delta_time_step = time() - time_start_step
 
-        for step_info in new_step_infos:
-            for brain_name, trainer in self.trainers.items():
-                if brain_name in self.trainer_metrics:
+        for brain_name, trainer in self.trainers.items():
+            if brain_name in self.trainer_metrics:
+                for _ in new_step_infos:
                     self.trainer_metrics[brain_name].add_delta_step(delta_time_step)
-                trainer.add_experiences(
-                    step_info.previous_all_brain_info,
-                    step_info.current_all_brain_info,
-                    step_info.brain_name_to_action_info[brain_name].outputs,
-                )
-                trainer.process_experiences(
-                    step_info.previous_all_brain_info, step_info.current_all_brain_info
-                )
+            trainer.add_and_process_experiences(new_step_infos)
         for brain_name, trainer in self.trainers.items():
             if brain_name in self.trainer_metrics:
                 self.trainer_metrics[brain_name].add_delta_step(delta_time_step)